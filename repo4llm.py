@@ -1,115 +1,282 @@
 import os
 import re
 import click
-import toml
-import fnmatch
-import scandir
-
-def filter_files(files, include, exclude):
-    if include:
-        files = [f for f in files if any(fnmatch.fnmatch(f, pattern) for pattern in include)]
-    if exclude:
-        files = [f for f in files if not any(fnmatch.fnmatch(f, pattern) for pattern in exclude)]
+import functools
+import shutil
+import stat
+
+SUFFIX_PATTERN = re.compile(r'^\*\.[A-Za-z0-9_]+$')
+NAME_PATTERN = re.compile(r'^([^/*?\[]+)$|^\*/([^/*?\[]+)/\*$')
+PROJECT_SECTION = re.compile(rb'^\[project\][ \t]*\r?$(.*?)(?=^\[|\Z)', re.MULTILINE | re.DOTALL)
+PROJECT_NAME = re.compile(rb'^name[ \t]*=[ \t]*"([^"\\]+)"[ \t]*\r?$', re.MULTILINE)
+GIT_REMOTE_URL = re.compile(rb'^[ \t]*url[ \t]*=[ \t]*"?([^\s#;"]+)', re.MULTILINE | re.IGNORECASE)
+README_PATTERN = re.compile(r'README(\.\w+)?', re.IGNORECASE)
+README_CANDIDATES = ('README', 'README.md', 'README.rst', 'README.txt')
+COPY_BUFSIZE = 1 << 20
+READAHEAD_BATCH = 256
+MEMOIZE_MIN_PATTERNS = 8
+TREE_CHUNK = 1 << 16
+INDENTS = [b'  ' * depth for depth in range(64)]
+
+def compile_patterns(patterns):
+    if not patterns:
+        return None
+    import fnmatch
+    names = set()
+    suffixes = []
+    others = []
+    for p in map(os.path.normcase, patterns):
+        name = NAME_PATTERN.match(p)
+        if name:
+            names.add(name.group(1) or name.group(2))
+        elif SUFFIX_PATTERN.match(p):
+            suffixes.append(p[1:])
+        else:
+            others.append(fnmatch.translate(p))
+    regex = re.compile('|'.join(others)) if others else None
+    memo = {} if len(others) >= MEMOIZE_MIN_PATTERNS else None
+    return frozenset(names), tuple(suffixes), regex, memo
+
+def match_patterns(name, spec):
+    names, suffixes, regex, _ = spec
+    name = os.path.normcase(name)
+    return name in names or name.endswith(suffixes) or (regex is not None and regex.match(name) is not None)
+
+def match_name(name, spec):
+    memo = spec[3]
+    if memo is None:
+        return match_patterns(name, spec)
+    matched = memo.get(name)
+    if matched is None:
+        matched = memo[name] = match_patterns(name, spec)
+    return matched
+
+def filter_files(files, include_spec):
+    if include_spec:
+        files = [rf for rf in files if match_name(rf[1], include_spec)]
     return files
 
+def load_toml(data):
+    try:
+        import tomllib
+    except ImportError:
+        import tomli as tomllib
+    return tomllib.loads(data.decode())
+
+@functools.lru_cache(maxsize=32)
 def get_project_name(directory):
     pyproject_path = os.path.join(directory, 'pyproject.toml')
     if os.path.exists(pyproject_path):
         try:
-            with open(pyproject_path, 'r') as f:
-                pyproject = toml.load(f)
-                if 'project' in pyproject and 'name' in pyproject['project']:
-                    return pyproject['project']['name']
-        except (toml.TomlDecodeError, KeyError, OSError):
+            with open(pyproject_path, 'rb') as f:
+                data = f.read()
+            section = PROJECT_SECTION.search(data)
+            body = section.group(1) if section else b''
+            name = b'"""' not in body and b"'''" not in body and PROJECT_NAME.search(body)
+            if name:
+                return name.group(1).decode()
+            pyproject = load_toml(data)
+            if 'project' in pyproject and 'name' in pyproject['project']:
+                return pyproject['project']['name']
+        except (ValueError, KeyError, OSError):
             pass
 
-    readme_files = [f for f in os.listdir(directory) if re.match(r'(?i)^README(\.\w+)?$', f)]
-    if readme_files:
-        with open(os.path.join(directory, readme_files[0]), 'r') as f:
+    readme_file = next((f for f in README_CANDIDATES if os.path.isfile(os.path.join(directory, f))), None)
+    if readme_file is None:
+        readme_file = next((f for f in os.listdir(directory) if README_PATTERN.fullmatch(f)), None)
+    if readme_file:
+        with open(os.path.join(directory, readme_file), 'r') as f:
             first_line = f.readline().strip()
             if first_line.startswith('# '):
                 return first_line[2:]
 
     return os.path.basename(os.path.abspath(directory))
 
+@functools.lru_cache(maxsize=32)
 def get_git_repo_name(directory):
     git_path = os.path.join(directory, '.git', 'config')
     if os.path.exists(git_path):
-        with open(git_path, 'r') as f:
-            for line in f:
-                if line.strip().startswith('url = '):
-                    repo_url = line.split('=', 1)[1].strip()
-                    return repo_url.split('/')[-1].replace('.git', '')
+        with open(git_path, 'rb') as f:
+            match = GIT_REMOTE_URL.search(f.read())
+        if match:
+            name = match.group(1).rstrip(b'/').rsplit(b'/', 1)[-1].rsplit(b':', 1)[-1]
+            return name.removesuffix(b'.git').decode()
     return None
 
-def check_max_depth(depth, max_depth, dirs):
-    if max_depth is not None and depth >= max_depth:
-        dirs[:] = []
+def is_excluded(path, name, is_dir, exclude_spec):
+    if exclude_spec is None:
+        return False
+    if is_dir:
+        return os.path.normcase(name) in exclude_spec[0] or match_patterns(path, exclude_spec)
+    regex = exclude_spec[2]
+    return match_name(name, exclude_spec) or (regex is not None and regex.match(os.path.normcase(path)) is not None)
+
+def _scan_dir(path, exclude_spec):
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return files, dirs
+
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        if is_excluded(entry.path, entry.name, is_dir, exclude_spec):
+            continue
+        if is_dir:
+            dirs.append(entry.path)
+            continue
+        try:
+            if entry.is_symlink() and entry.is_dir():
+                continue
+        except OSError:
+            pass
+        files.append(entry.name)
+    return files, dirs
+
+def parallel_walk(directory, max_depth, exclude_spec, workers=None):
+    from concurrent.futures import ThreadPoolExecutor
+    if workers is None:
+        workers = (os.cpu_count() or 1) * 2
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def scan(path, depth):
+            files, dirs = _scan_dir(path, exclude_spec)
+            if max_depth is not None and depth >= max_depth:
+                return files, []
+            return files, [(d, executor.submit(scan, d, depth + 1)) for d in dirs]
 
-def collect_included_files(directory, include, exclude, max_depth):
-    included_files = []
-    for root, dirs, files in scandir.walk(directory, topdown=True):
-        depth = root[len(directory):].count(os.sep)
-        check_max_depth(depth, max_depth, dirs)
+        yield from _walk(executor.submit(scan, directory, 0), directory, 0)
 
-        dirs[:] = [d for d in dirs if not d.startswith('.') and not any(fnmatch.fnmatch(os.path.join(root, d), pattern) for pattern in exclude)]
-        files = [f for f in files if not f.startswith('.') and not any(fnmatch.fnmatch(os.path.join(root, f), pattern) for pattern in exclude)]
+def sendfile_fd(output):
+    if not hasattr(os, 'sendfile'):
+        return None
+    try:
+        fd = output.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        return None
+    import fcntl
+    if fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_APPEND:
+        return None
+    return fd
 
-        files = filter_files(files, include, exclude)
+def copy_file(path, output, out_fd=None):
+    with open(path, 'rb') as src:
+        if out_fd is None:
+            shutil.copyfileobj(src, output, COPY_BUFSIZE)
+            return
+        output.flush()
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        while offset < size:
+            try:
+                sent = os.sendfile(out_fd, src.fileno(), offset, size - offset)
+            except OSError:
+                if offset:
+                    raise
+                shutil.copyfileobj(src, output, COPY_BUFSIZE)
+                return
+            if not sent:
+                break
+            offset += sent
+
+def prefetch_files(files):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for root, name in files:
+        try:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+def _walk(future, path, depth):
+    files, dirs = future.result()
+    yield path, depth, files
+    for d, child in dirs:
+        yield from _walk(child, d, depth + 1)
+
+def walk_tree(directory, exclude_spec, max_depth):
+    for root, depth, files in parallel_walk(directory, max_depth, exclude_spec):
+        yield 'dir', depth, root, os.path.basename(root if depth else os.path.normpath(root))
         for f in files:
-            included_files.append(os.path.join(root, f))
-    return included_files
+            yield 'file', depth + 1, root, f
 
 @click.command()
 @click.argument('directory', type=click.Path(exists=True, file_okay=False, readable=True), default='.')
 @click.option('--include', '-i', multiple=True, default=['README*', '*.py', '*.ts', '*.js', '*.go', '*.rust', '*.h', '*.c', '*.cpp', '*.conf'], help='Only include files matching these patterns (default: *.py, *.ts, *.js, *.go, *.rust, *.h, *.c, *.cpp, *.conf)')
 @click.option('--exclude', '-e', multiple=True, help='Exclude files matching these patterns (e.g. *.pyc, *.log)')
 @click.option('--max-depth', '-d', type=int, default=None, help='Max depth to traverse in the directory tree')
-@click.option('--output', '-o', type=click.File('w'), default='-', help='Output file to save the result (default is stdout)')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file to save the result (default is stdout)')
+@click.option('--readahead', is_flag=True, help='Ask the kernel to prefetch included files in batches before they are written out (helps on cold caches)')
 @click.option('--instructions', '-t', type=str, default="This is relevant code from the our project repository. If CANVAS or ARTIFACT functionality is available, create one named for each file and output the content, then acknowledge that we are ready to begin work on these files. If the functionality is not available, simply acknowledge that you are ready to begin work on these files.", help='Custom instructions to include at the end of the output')
-def generate_tree(directory, include, exclude, max_depth, output, instructions):
+def generate_tree(directory, include, exclude, max_depth, output, readahead, instructions):
     project_name = get_project_name(directory)
     git_repo_name = get_git_repo_name(directory)
     project_title = git_repo_name if git_repo_name else project_name
 
-    click.echo(f"Project: {project_title}\n", file=output)
+    click.echo(f"Project: {project_title}\n".encode(), file=output)
 
-    click.echo("<filetree>", file=output)
-    for root, dirs, files in scandir.walk(directory, topdown=True):
-        depth = root[len(directory):].count(os.sep)
-        check_max_depth(depth, max_depth, dirs)
+    include_spec = compile_patterns(include)
+    exclude_spec = compile_patterns(exclude)
+    files = add_filetree(output, walk_tree(directory, exclude_spec, max_depth))
+    included_files = filter_files(files, include_spec)
 
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
+    included_files.sort(key=lambda rf: (README_PATTERN.fullmatch(rf[1]) is None, os.path.join(*rf)))
+    add_file_contents(output, included_files, readahead)
 
-        indent = '  ' * depth
-        click.echo(f"{indent}{os.path.basename(root)}/", file=output)
-
-        all_files = [f for f in files if not f.startswith('.')]
-        for f in all_files:
-            click.echo(f"{indent}  {f}", file=output)
-    click.echo("</filetree>", file=output)
-
-    included_files = collect_included_files(directory, include, exclude, max_depth)
+    add_instructions(output, instructions)
 
-    readme_files = [f for f in included_files if re.match(r'(?i).*/README(\.\w+)?$', f)]
-    included_files = sorted(included_files, key=lambda x: (x not in readme_files, x))
+def add_filetree(output, entries):
+    files = []
+    buf = bytearray(b"<filetree>\n")
+    for kind, depth, root, name in entries:
+        buf += INDENTS[depth] if depth < len(INDENTS) else b'  ' * depth
+        buf += name.encode()
+        if kind == 'dir':
+            buf += b"/\n"
+        else:
+            buf += b"\n"
+            files.append((root, name))
+        if len(buf) >= TREE_CHUNK:
+            output.write(buf)
+            output.flush()
+            buf.clear()
+    buf += b"</filetree>\n"
+    output.write(buf)
+    return files
 
-    click.echo("\n---\n", file=output)
-    for file in included_files:
-        click.echo(f"`{file}`\n", file=output)
-        click.echo("```", file=output)
+def add_file_contents(output, included_files, readahead=False):
+    click.echo(b"\n---\n", file=output)
+    out_fd = sendfile_fd(output)
+    for i, (root, name) in enumerate(included_files):
+        if readahead and i % READAHEAD_BATCH == 0:
+            prefetch_files(included_files[i:i + READAHEAD_BATCH])
+        file = os.path.join(root, name)
+        output.write(f"`{file}`\n\n```\n".encode())
         try:
-            with open(file, 'r') as f:
-                click.echo(f.read(), file=output)
-        except Exception as e:
-            click.echo(f"Error reading file {file}: {e}", file=output)
-        click.echo("```\n", file=output)
-
-    add_instructions(output, instructions)
+            copy_file(file, output, out_fd)
+            output.write(b"\n")
+        except OSError as e:
+            output.write(f"Error reading file {file}: {e}\n".encode())
+        output.write(b"```\n\n")
 
 def add_instructions(output, instructions):
-    click.echo("---\n", file=output)
-    click.echo(instructions, file=output)
+    click.echo(b"---\n", file=output)
+    click.echo(instructions.encode(), file=output)
 
 if __name__ == '__main__':
     generate_tree()